@@ -5,10 +5,59 @@ Reads rates from JSON configuration file
 """
 
 import os
+import sys
 import json
+import mmap
+import multiprocessing as mp
+import numpy as np
 import pandas as pd
-from datetime import datetime
 import glob
+import operator
+from functools import reduce
+
+SEASONS = ['summer', 'winter']
+PERIODS = ['on_peak', 'off_peak', 'super_off_peak']
+
+# Shared dtypes so Season/TimePeriod stay categorical across files
+SEASON_DTYPE = pd.CategoricalDtype(SEASONS)
+PERIOD_DTYPE = pd.CategoricalDtype(PERIODS)
+
+# Header line that starts the interval data section
+DATA_HEADER = b'Meter Number,Date,Start Time'
+
+# Upper bound on the size of the metadata block preceding DATA_HEADER
+METADATA_MAX_BYTES = 64 * 1024
+
+# Interval columns needed from the GBD data section and their types;
+# readings carry only a few significant digits, so float32 is plenty
+DATA_TYPES = {
+    'Date': str,
+    'Start Time': str,
+    'Consumption': np.float32,
+    'Generation': np.float32,
+    'Net': np.float32
+}
+
+# Output columns
+OUTPUT_COLUMNS = [
+    'name', 'address', 'account_number', 'meter_number',
+    'DateTime', 'Consumption', 'Generation', 'Net',
+    'Season', 'TimePeriod', 'Rate', 'Cost'
+]
+
+# Processor shared by pool workers, installed once per worker by
+# _init_worker. Its lookup tables are read-only; workers must not mutate
+# them, so under fork they stay in pages shared with the parent.
+_worker_processor = None
+
+def _init_worker(processor):
+    """Install the processor for this pool worker"""
+    global _worker_processor
+    _worker_processor = processor
+
+def _process_file_in_worker(filepath):
+    """Process a single file with the worker's processor"""
+    return _worker_processor._process_file_safe(filepath)
 
 class SDGEProcessor:
     def __init__(self, config_file='sdge_rates.json'):
@@ -16,61 +65,75 @@ class SDGEProcessor:
         with open(config_file, 'r') as f:
             self.config = json.load(f)
         
-        # Convert holiday strings to datetime objects
-        self.holidays = [
-            datetime.strptime(h, '%Y-%m-%d').date() 
-            for h in self.config['holidays']
+        # Convert holiday strings to day numbers (days since 1970-01-01)
+        self.holiday_days = np.array(
+            self.config['holidays'], dtype='datetime64[D]'
+        ).astype(np.int64)
+        
+        # Season codes indexed by [month - 1]
+        summer_months = self.config['rates']['summer']['months']
+        self.season_table = np.array(
+            [0 if month in summer_months else 1 for month in range(1, 13)],
+            dtype=np.int8
+        )
+        
+        # Rates indexed by [season_code, period_code]
+        self.rate_table = np.array([
+            [self.config['rates'][season][period] for period in PERIODS]
+            for season in SEASONS
+        ], dtype=np.float32)
+        
+        # Period codes indexed by [is_weekend_holiday, month - 1, hour]
+        self.period_table = self.build_period_table()
+        
+        # Rates indexed like period_table, folding the season and period
+        # lookups into one table
+        self.slot_rate_table = self.rate_table[
+            self.season_table[np.newaxis, :, np.newaxis],
+            self.period_table
         ]
     
-    def get_season(self, date):
-        """Determine season based on month"""
-        month = date.month
-        if month in self.config['rates']['summer']['months']:
-            return 'summer'
-        return 'winter'
-    
-    def is_holiday(self, date):
-        """Check if date is a holiday"""
-        return date.date() in self.holidays
-    
-    def get_time_period(self, hour, is_weekend_holiday, month):
-        """Determine time period based on hour and day type"""
-        schedule = 'weekend_holiday' if is_weekend_holiday else 'weekday'
-        periods = self.config['time_periods'][schedule]
-        
-        # Check each time period
-        for period_name, hours_list in periods.items():
-            if period_name == 'special_periods':
-                continue
-            for start, end in hours_list:
-                if start <= hour < end:
-                    return period_name.replace('_', '_')
-        
-        # Check special periods for weekdays
-        if not is_weekend_holiday and 'special_periods' in periods:
-            special = periods['special_periods']
-            if month in special['months']:
-                for start, end in special.get('super_off_peak_extra', []):
-                    if start <= hour < end:
-                        return 'super_off_peak'
-        
-        return 'off_peak'  # Default
-    
-    def process_file(self, filepath):
-        """Process a single GBD file"""
-        # Read metadata
-        with open(filepath, 'r') as f:
-            lines = f.readlines()
+    def build_period_table(self):
+        """Flatten the time period schedule into a table of period codes"""
+        # Hours not covered by any period default to off-peak
+        table = np.full((2, 12, 24), PERIODS.index('off_peak'), dtype=np.int8)
         
-        # Find data start
-        header_row = 0
-        for i, line in enumerate(lines):
-            if 'Meter Number,Date,Start Time' in line:
-                header_row = i
-                break
+        for is_wh, schedule in enumerate(['weekday', 'weekend_holiday']):
+            periods = self.config['time_periods'][schedule]
+            
+            # Special periods only apply to weekday hours that no regular
+            # period covers, so fill them first
+            if not is_wh and 'special_periods' in periods:
+                special = periods['special_periods']
+                for month in special['months']:
+                    for start, end in special.get('super_off_peak_extra', []):
+                        table[is_wh, month - 1, start:end] = PERIODS.index('super_off_peak')
+            
+            # The first listed period wins where ranges overlap, so fill
+            # in reverse order
+            regular = [
+                (name, hours) for name, hours in periods.items()
+                if name != 'special_periods'
+            ]
+            for period_name, hours_list in reversed(regular):
+                for start, end in hours_list:
+                    table[is_wh, :, start:end] = PERIODS.index(period_name)
         
-        # Read data
-        df = pd.read_csv(filepath, skiprows=header_row)
+        return table
+    
+    def read_metadata(self, filepath):
+        """Find the data header row and extract account info"""
+        # The header sits a dozen lines in; bound the search so files
+        # without one fail fast instead of being scanned end to end
+        with open(filepath, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header_pos = mm.find(DATA_HEADER, 0, METADATA_MAX_BYTES)
+                if header_pos == -1:
+                    raise ValueError("Data header not found")
+                metadata = mm[:header_pos]
+        
+        header_row = metadata.count(b'\n')
+        lines = metadata.decode().splitlines()
         
         # Extract account info
         account_info = {
@@ -80,45 +143,79 @@ class SDGEProcessor:
             'meter_number': lines[6].split(',')[1].strip().strip('\r')
         }
         
-        # Process timestamps
-        df['DateTime'] = pd.to_datetime(df['Date'] + ' ' + df['Start Time'])
-        df['Hour'] = df['DateTime'].dt.hour
-        df['Weekday'] = df['DateTime'].dt.dayofweek
-        df['IsWeekend'] = df['Weekday'].isin([5, 6])
-        df['IsHoliday'] = df['DateTime'].apply(self.is_holiday)
-        df['IsWeekendHoliday'] = df['IsWeekend'] | df['IsHoliday']
+        return header_row, account_info
+    
+    def process_file(self, filepath):
+        """Process a single GBD file"""
+        header_row, account_info = self.read_metadata(filepath)
+        
+        # Read data
+        df = pd.read_csv(
+            filepath,
+            header=header_row,
+            usecols=list(DATA_TYPES),
+            dtype=DATA_TYPES,
+            engine='pyarrow'
+        )
+        
+        # Process timestamps; intermediate fields stay as NumPy arrays
+        # instead of being materialized as DataFrame columns
+        df['DateTime'] = pd.to_datetime(
+            df['Date'] + ' ' + df['Start Time'],
+            format='%m/%d/%Y %I:%M %p',
+            cache=True
+        )
+        df = df.drop(columns=['Date', 'Start Time'])
+        days = df['DateTime'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        hour = df['DateTime'].dt.hour.to_numpy()
+        month = df['DateTime'].dt.month.to_numpy()
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is the weekday with Monday=0
+        is_weekend = (days + 3) % 7 >= 5
+        is_holiday = np.isin(days, self.holiday_days)
+        is_weekend_holiday = is_weekend | is_holiday
         
         # Determine season and time period
-        df['Season'] = df['DateTime'].apply(self.get_season)
-        df['Month'] = df['DateTime'].dt.month
-        df['TimePeriod'] = df.apply(
-            lambda row: self.get_time_period(
-                row['Hour'], 
-                row['IsWeekendHoliday'], 
-                row['Month']
-            ), 
-            axis=1
+        season_code = self.season_table[month - 1]
+        df['Season'] = pd.Categorical.from_codes(season_code, dtype=SEASON_DTYPE)
+        
+        # Flat index into the [is_weekend_holiday, month - 1, hour] tables,
+        # computed once and shared by the period and rate lookups
+        slot = np.ravel_multi_index(
+            (is_weekend_holiday.astype(np.intp), month - 1, hour),
+            self.period_table.shape
         )
+        period_code = np.take(self.period_table, slot)
+        df['TimePeriod'] = pd.Categorical.from_codes(period_code, dtype=PERIOD_DTYPE)
         
         # Apply rates
-        df['Rate'] = df.apply(
-            lambda row: self.config['rates'][row['Season']][row['TimePeriod']], 
-            axis=1
-        )
+        df['Rate'] = np.take(self.slot_rate_table, slot)
         
         # Calculate cost
-        df['Net'] = df['Net'].astype(float)
         df['Cost'] = df['Net'] * df['Rate']
         
-        # Add account info
+        # Add account info as single-category columns (one code per row
+        # instead of one string per row)
+        codes = np.zeros(len(df), dtype=np.int8)
         for key, value in account_info.items():
-            df[key] = value
+            df[key] = pd.Categorical.from_codes(codes, [value])
         
         return df, account_info
     
+    def _process_file_safe(self, filepath):
+        """Process a single file in a worker, returning (result, error)"""
+        try:
+            df, account_info = self.process_file(filepath)
+            # Per-period partial sums, reduced by the parent; keep every
+            # period so partials from different files align when added
+            period_totals = df.groupby('TimePeriod', observed=False)[['Net', 'Cost']].sum()
+            # Format the output rows here so the parent only appends text
+            csv_text = df[OUTPUT_COLUMNS].to_csv(header=False, index=False)
+            return (csv_text, len(df), account_info, period_totals), None
+        except Exception as e:
+            return None, str(e)
+    
     def process_folder(self, input_folder, output_file):
         """Process all GBD files in folder"""
-        all_data = []
         csv_files = glob.glob(os.path.join(input_folder, '*.csv'))
         
         if not csv_files:
@@ -127,54 +224,64 @@ class SDGEProcessor:
         
         print(f"Processing {len(csv_files)} files...")
         
-        for csv_file in csv_files:
-            print(f"\n{os.path.basename(csv_file)}:")
-            try:
-                df, account_info = self.process_file(csv_file)
-                all_data.append(df)
-                
-                # Summary
-                total_kwh = df['Net'].sum()
-                total_cost = df['Cost'].sum()
-                print(f"  Account: {account_info['name']}")
-                print(f"  Usage: {total_kwh:.2f} kWh")
-                print(f"  Cost: ${total_cost:.2f}")
-                
-            except Exception as e:
-                print(f"  Error: {e}")
-        
-        if all_data:
-            # Combine and save
-            combined = pd.concat(all_data, ignore_index=True)
-            
-            # Output columns
-            columns = [
-                'name', 'address', 'account_number', 'meter_number',
-                'DateTime', 'Consumption', 'Generation', 'Net',
-                'Season', 'TimePeriod', 'Rate', 'Cost'
-            ]
-            
-            combined[columns].to_csv(output_file, index=False)
+        out = None
+        records = 0
+        period_totals = []
+        
+        # Files are independent, so process them in parallel; imap keeps
+        # results in file order. On Linux, fork lets workers inherit this
+        # processor and its tables; elsewhere it is pickled once per worker
+        # rather than once per file.
+        ctx = mp.get_context('fork' if sys.platform.startswith('linux') else None)
+        processes = min(len(csv_files), os.cpu_count() or 1)
+        try:
+            with ctx.Pool(processes, initializer=_init_worker, initargs=(self,)) as pool:
+                results = pool.imap(_process_file_in_worker, csv_files)
+                for csv_file, (result, error) in zip(csv_files, results):
+                    print(f"\n{os.path.basename(csv_file)}:")
+                    if error is not None:
+                        print(f"  Error: {error}")
+                        continue
+                    
+                    csv_text, file_records, account_info, file_totals = result
+                    
+                    # Append each file to the output as it arrives rather
+                    # than holding every file in memory for one final concat
+                    if out is None:
+                        out = open(output_file, 'w', newline='')
+                        out.write(','.join(OUTPUT_COLUMNS) + os.linesep)
+                    out.write(csv_text)
+                    records += file_records
+                    period_totals.append(file_totals)
+                    
+                    # Summary
+                    total_kwh = file_totals['Net'].sum()
+                    total_cost = file_totals['Cost'].sum()
+                    print(f"  Account: {account_info['name']}")
+                    print(f"  Usage: {total_kwh:.2f} kWh")
+                    print(f"  Cost: ${total_cost:.2f}")
+        finally:
+            if out is not None:
+                out.close()
+        
+        if out is not None:
             print(f"\nSaved to: {output_file}")
             
+            totals = reduce(operator.add, period_totals)
+            
             # Total summary
             print(f"\nTOTAL SUMMARY:")
-            print(f"Records: {len(combined):,}")
-            print(f"Usage: {combined['Net'].sum():.2f} kWh")
-            print(f"Cost: ${combined['Cost'].sum():.2f}")
+            print(f"Records: {records:,}")
+            print(f"Usage: {totals['Net'].sum():.2f} kWh")
+            print(f"Cost: ${totals['Cost'].sum():.2f}")
             
             # By time period
             print("\nBy Time Period:")
-            summary = combined.groupby('TimePeriod').agg({
-                'Net': 'sum',
-                'Cost': 'sum'
-            }).round(2)
+            summary = totals.round(2)
             for period, row in summary.iterrows():
                 print(f"  {period}: {row['Net']:.2f} kWh, ${row['Cost']:.2f}")
 
 if __name__ == "__main__":
-    import sys
-    
     # Default paths
     input_folder = sys.argv[1] if len(sys.argv) > 1 else "./gbd_data"
     output_file = sys.argv[2] if len(sys.argv) > 2 else "./processed_sdge_data.csv"